@@ -22,6 +22,7 @@ HIGH_THRESHOLD=80  # user defined "HIGH" memory usage threshold (%)
 VERY_HIGH_THRESHOLD=90  # user defined "VERY HIGH" memory usage threshold (%)
 CRITICAL_THRESHOLD=95  # user defined "CRITICAL" memory usage threshold (%)
 MAX_LOG_ENTRIES=10 # number of maximum log entries in the log file before overriding oldest entries
+LOG_UNCHANGED_EVERY=12 # when swappiness is unchanged, only log every N-th check (0 disables these entries)
 DISK_IO_SAMPLE_RATE=2 # how many seconds to sample disk metrics
 
 ###############################################################
@@ -36,6 +37,9 @@ NETWORK_WEIGHT=20
 # Log file name 
 LOG_FILE="/tmp/smartswap.log"
 
+# Kernel swappiness tunable
+SWAPPINESS_FILE="/proc/sys/vm/swappiness"
+
 # Ensure we're running as root
 if [ "$(id -u)" -ne 0 ]; then
     echo "This script must be run as root" >&2
@@ -47,9 +51,72 @@ get_memory_usage() {
     free | grep Mem | awk '{print int($3/$2 * 100)}'
 }
 
+# CPU time counters from the previous check, used to compute usage as a delta
+PREV_CPU_TOTAL=0
+PREV_CPU_IDLE=0
+
 # Function to get current CPU usage as a percentage
+# Non-blocking: usage is measured since the previous call by diffing /proc/stat,
+# so call it directly (not in a subshell) and read the result from CPU_USAGE
 get_cpu_usage() {
-    top -bn1 | grep "Cpu(s)" | sed "s/.*, *\([0-9.]*\)%* id.*/\1/" | awk '{print int(100 - $1)}'
+    local label user nice system idle iowait irq softirq steal rest
+    read -r label user nice system idle iowait irq softirq steal rest < /proc/stat
+    
+    local total=$((user + nice + system + idle + iowait + irq + softirq + steal))
+    local total_delta=$((total - PREV_CPU_TOTAL))
+    local idle_delta=$((idle - PREV_CPU_IDLE))
+    PREV_CPU_TOTAL=$total
+    PREV_CPU_IDLE=$idle
+    
+    if [ "$total_delta" -gt 0 ]; then
+        CPU_USAGE=$(( (total_delta - idle_delta) * 100 / total_delta ))
+    else
+        CPU_USAGE=0
+    fi
+}
+
+# Disks sampled by the /proc/diskstats fallback in get_io_usage, maintained by refresh_disks
+DISKS=""
+DISKS_KEY=""
+
+# Function to rediscover disks only when the set of block devices changes
+# Globbing /sys/block is cheap compared to the discovery pipelines, which only run on a change
+refresh_disks() {
+    local devices=(/sys/block/*)
+    if [ "${devices[*]}" = "$DISKS_KEY" ]; then
+        return
+    fi
+    DISKS_KEY="${devices[*]}"
+    
+    # Get stats for all disk types - sda: SATA nvme: NVMe mmcblk: eMMC/SD)
+    DISKS=$(ls -l /dev/disk/by-path/ 2>/dev/null | grep -v "part[0-9]" | awk '{print $NF}' | sed 's/\.\.\/\.\.\///' | grep -E '^sd|^nvme|^mmcblk|^xvd|^vd')
+    if [ -z "$DISKS" ]; then
+        DISKS=$(lsblk -d -o NAME | grep -E '^sd|^nvme|^mmcblk|^xvd|^vd')
+    fi
+    
+    # fallback to direct disk stat calculation
+    if [ -z "$DISKS" ]; then
+        DISKS=$(awk '$3 ~ /^(sd[a-z]+|nvme[0-9]+n[0-9]+|mmcblk[0-9]+|xvd[a-z]+|vd[a-z]+)$/ {print $3}' /proc/diskstats)
+    fi
+}
+
+# Function to sum sectors read and written for the given disks in one pass over /proc/diskstats
+# With no disk list, every whole SATA/NVMe/eMMC/Xen/virtio disk is counted
+# Sets DISK_SECTORS_READ and DISK_SECTORS_WRITTEN
+read_disk_sectors() {
+    local wanted=" ${1//$'\n'/ } "
+    local major minor name reads reads_merged sectors_read read_time writes writes_merged sectors_written rest
+    DISK_SECTORS_READ=0
+    DISK_SECTORS_WRITTEN=0
+    while read -r major minor name reads reads_merged sectors_read read_time writes writes_merged sectors_written rest; do
+        if [ -n "$1" ]; then
+            [[ "$wanted" == *" $name "* ]] || continue
+        else
+            [[ "$name" =~ ^(sd[a-z]+|nvme[0-9]+n[0-9]+|mmcblk[0-9]+|xvd[a-z]+|vd[a-z]+)$ ]] || continue
+        fi
+        DISK_SECTORS_READ=$((DISK_SECTORS_READ + sectors_read))
+        DISK_SECTORS_WRITTEN=$((DISK_SECTORS_WRITTEN + sectors_written))
+    done < /proc/diskstats
 }
 
 # Function to get current I/O usage 
@@ -78,53 +145,19 @@ get_io_usage() {
     else
         # Fall back if iostat is not available
         # Check disk activity using /proc/diskstats for all disk types
-        local read_before=0
-        local write_before=0
-        
-        # Get stats for all disk types - sda: SATA nvme: NVMe mmcblk: eMMC/SD)
-        local disks=$(ls -l /dev/disk/by-path/ 2>/dev/null | grep -v "part[0-9]" | awk '{print $NF}' | sed 's/\.\.\/\.\.\///' | grep -E '^sd|^nvme|^mmcblk|^xvd|^vd')
-        if [ -z "$disks" ]; then
-            disks=$(lsblk -d -o NAME | grep -E '^sd|^nvme|^mmcblk|^xvd|^vd')
-        fi
+        # Disks discovered by refresh_disks
+        local disks=$DISKS
         
-        # fallback to direct disk stat calculation
-        if [ -z "$disks" ]; then
-            disks=$(grep -E ' sd[a-z] | nvme[0-9]n[0-9] | mmcblk[0-9] | xvd[a-z] | vd[a-z] ' /proc/diskstats | awk '{print $3}')
-        fi
-        
-        # fallback to more general disk stat calculation 
-        if [ -z "$disks" ]; then
-            read_before=$(grep -E ' sd[a-z] | nvme[0-9]n[0-9] | mmcblk[0-9] | xvd[a-z] | vd[a-z] ' /proc/diskstats 2>/dev/null | awk '{sum += $6} END {print sum}')
-            write_before=$(grep -E ' sd[a-z] | nvme[0-9]n[0-9] | mmcblk[0-9] | xvd[a-z] | vd[a-z] ' /proc/diskstats 2>/dev/null | awk '{sum += $10} END {print sum}')
-        else
-            # Loop over disks
-            for disk in $disks; do
-                disk_stats=$(grep " ${disk} " /proc/diskstats 2>/dev/null)
-                if [ -n "$disk_stats" ]; then
-                    read_before=$((read_before + $(echo "$disk_stats" | awk '{print $6}')))
-                    write_before=$((write_before + $(echo "$disk_stats" | awk '{print $10}')))
-                fi
-            done
-        fi
+        read_disk_sectors "$disks"
+        local read_before=$DISK_SECTORS_READ
+        local write_before=$DISK_SECTORS_WRITTEN
         
         sleep 1
         
-        local read_after=0
-        local write_after=0
-        
         # Same approach for after measurements
-        if [ -z "$disks" ]; then
-            read_after=$(grep -E ' sd[a-z] | nvme[0-9]n[0-9] | mmcblk[0-9] | xvd[a-z] | vd[a-z] ' /proc/diskstats 2>/dev/null | awk '{sum += $6} END {print sum}')
-            write_after=$(grep -E ' sd[a-z] | nvme[0-9]n[0-9] | mmcblk[0-9] | xvd[a-z] | vd[a-z] ' /proc/diskstats 2>/dev/null | awk '{sum += $10} END {print sum}')
-        else
-            for disk in $disks; do
-                disk_stats=$(grep " ${disk} " /proc/diskstats 2>/dev/null)
-                if [ -n "$disk_stats" ]; then
-                    read_after=$((read_after + $(echo "$disk_stats" | awk '{print $6}')))
-                    write_after=$((write_after + $(echo "$disk_stats" | awk '{print $10}')))
-                fi
-            done
-        fi
+        read_disk_sectors "$disks"
+        local read_after=$DISK_SECTORS_READ
+        local write_after=$DISK_SECTORS_WRITTEN
         
         # Calculate I/O operations per second & percentage conversion
         # Scale differently for different drive types (NVMEs can handle more IOPS)
@@ -132,7 +165,7 @@ get_io_usage() {
         local io_percent=0
         
         # NVMe drive check
-        if echo "$disks" | grep -q "nvme"; then
+        if [[ "$disks" == *nvme* ]]; then
             # NVMe drives can handle ~500K IOPS - scale to (500 IOPS = ~1%)
             io_percent=$(( iops / 500 ))
         else
@@ -149,44 +182,91 @@ get_io_usage() {
     fi
 }
 
+# Function to read the monotonic clock (time since boot) in centiseconds into UPTIME_CS
+read_uptime() {
+    local uptime idle
+    read -r uptime idle < /proc/uptime
+    UPTIME_CS=$(( 10#${uptime/./} ))
+}
+
+# Network byte counters and time of the previous check, used to compute throughput as a delta
+PREV_NET_BYTES=0
+PREV_NET_TIME_CS=0
+
 # Function to get current network usage (simple version)
+# Non-blocking: throughput is measured since the previous call from /proc/net/dev counters,
+# so call it directly (not in a subshell) and read the result from NETWORK_USAGE
 get_network_usage() {
-    # Get network utilization 
-    if command -v ifstat >/dev/null 2>&1; then
-        # Get total network throughput and normalize to percentage (assuming 1Gbps max)
-        network_percent=$(ifstat 1 1 | tail -n 1 | awk '{print int(($1 + $2) * 8 / 10000000 * 100)}')
-        
-	# Cap at 100% (same bug as above)
-        if [ "$network_percent" -gt 100 ]; then
-            network_percent=100
+    local iface data fields
+    local bytes=0
+    while IFS=: read -r iface data; do
+        iface=${iface// /}
+        # Skip the header lines and loopback traffic
+        if [ -z "$data" ] || [ "$iface" = "lo" ]; then
+            continue
         fi
-        
-        echo "$network_percent"
-    else
-        # Default to 50% if ifstat not available
-        echo 50
+        fields=($data)
+        bytes=$((bytes + fields[0] + fields[8]))
+    done < /proc/net/dev
+    read_uptime
+    
+    local bytes_delta=$((bytes - PREV_NET_BYTES))
+    local time_delta_cs=$((UPTIME_CS - PREV_NET_TIME_CS))
+    PREV_NET_BYTES=$bytes
+    PREV_NET_TIME_CS=$UPTIME_CS
+    
+    # Counters go backwards when an interface disappears between checks; start again from this baseline
+    if [ "$time_delta_cs" -le 0 ] || [ "$bytes_delta" -lt 0 ]; then
+        NETWORK_USAGE=0
+        return
+    fi
+    
+    # Get total network throughput in KB/s and normalize to percentage (same scale as the former ifstat reading)
+    local network_percent=$(( bytes_delta * 100 * 8 / (time_delta_cs * 1024 * 100000) ))
+    
+    # Cap at 100% (same bug as above)
+    if [ "$network_percent" -gt 100 ]; then
+        network_percent=100
     fi
+    
+    NETWORK_USAGE=$network_percent
 }
 
 # Function to get current swappiness value
+# Uses the read builtin rather than forking cat on every check
 get_swappiness() {
-    cat /proc/sys/vm/swappiness
+    local value
+    read -r value < "$SWAPPINESS_FILE"
+    echo "$value"
 }
 
 # Function to set swappiness value
+# The value read back from the kernel is left in SWAPPINESS, since the write can be rejected
+# (e.g. values above 100 on kernels before 5.8)
 set_swappiness() {
     local new_value=$1
     echo "Setting swappiness to $new_value"
-    echo $new_value > /proc/sys/vm/swappiness
+    echo $new_value > "$SWAPPINESS_FILE"
     
     # Verify the change
-    local current=$(get_swappiness)
-    echo "Current swappiness is now: $current"
+    read -r SWAPPINESS < "$SWAPPINESS_FILE"
+    echo "Current swappiness is now: $SWAPPINESS"
+}
+
+# Function to (re)open the log file on a persistent descriptor, LOG_FD
+# Keeping it open avoids an open/close of the log on every write
+open_log() {
+    if [ -n "$LOG_FD" ]; then
+        exec {LOG_FD}>&-
+    fi
+    exec {LOG_FD}>>"$LOG_FILE"
 }
 
 # Function to log system metrics and swappiness
 log_metrics() {
-    local timestamp=$(date "+%Y-%m-%d %H:%M:%S")
+    # printf's %(...)T formats the time in-shell instead of forking date for every entry
+    local timestamp
+    printf -v timestamp '%(%Y-%m-%d %H:%M:%S)T' -1
     local mem_usage=$1
     local cpu_usage=$2
     local io_usage=$3
@@ -194,15 +274,17 @@ log_metrics() {
     local swappiness=$5
     local original_swappiness=$6
     
-    # Count number of timestamp entries
-    local num_entries=$(grep -c "^[0-9]\{4\}-[0-9]\{2\}-[0-9]\{2\} [0-9]\{2\}:[0-9]\{2\}:[0-9]\{2\}:" "${LOG_FILE}" 2>/dev/null || echo 0)
-    
-    # If we have 100 entries, truncate the log file by keeping only the last 99 entries
-    if [ "${num_entries}" -ge $MAX_LOG_ENTRIES ]; then
-        # Create temp file with last 99 entries
+    # If we have $MAX_LOG_ENTRIES entries, truncate the log file by keeping only the last ones
+    # LOG_ENTRIES is tracked in memory so the log isn't re-scanned on every call
+    if [ "${LOG_ENTRIES}" -ge $MAX_LOG_ENTRIES ]; then
+        # Create temp file with last N entries
         tail -n $((7 * MAX_LOG_ENTRIES)) "${LOG_FILE}" > "${LOG_FILE}.tmp" # Keep last N entries
         # Replace original with truncated version
         mv "${LOG_FILE}.tmp" "${LOG_FILE}"
+        # The old descriptor still points at the replaced file
+        open_log
+        # Recount only what was kept, since the trim is line-based
+        LOG_ENTRIES=$(grep -c "^[0-9]\{4\}-[0-9]\{2\}-[0-9]\{2\} [0-9]\{2\}:[0-9]\{2\}:[0-9]\{2\}:" "${LOG_FILE}")
     fi
     
     # Append new entry
@@ -215,11 +297,13 @@ log_metrics() {
         echo "Original swappiness: ${original_swappiness}"
         echo "Current swappiness: ${swappiness}"
         echo "-------"
-    } >> "${LOG_FILE}"
+    } >&"${LOG_FD}"
+    LOG_ENTRIES=$((LOG_ENTRIES + 1))
 }
 
 # Function to calculate adjusted swappiness based on CPU, RAM, I/O and network usage
 # Swappiness has a range from 0-200 and adjusted in increments of 5 for granularity 
+# Pure arithmetic, so the result is returned in OPTIMAL_SWAPPINESS rather than through a subshell
 calculate_optimal_swappiness() {
     local mem_usage=$1
     local cpu_usage=$2
@@ -271,23 +355,14 @@ calculate_optimal_swappiness() {
         fi
     fi
     
-    # CPU-based swappiness logic (high CPU usage = lower swappiness)
-    local cpu_based_swappiness=$((200 - cpu_usage * 2))
-    if [ "$cpu_based_swappiness" -lt 0 ]; then
-        cpu_based_swappiness=0
-    fi
-    
-    # IO-based swappiness logic (high IO = higher swappiness)
-    local io_based_swappiness=$((io_usage * 2))
-    if [ "$io_based_swappiness" -gt 200 ]; then
-        io_based_swappiness=200
-    fi
-    
-    # Network-based swappiness logic (high network = moderate swappiness)
-    local network_based_swappiness=$((network_usage + 50))
-    if [ "$network_based_swappiness" -gt 200 ]; then
-        network_based_swappiness=200
-    fi
+    # Per-metric swappiness, each clamped to the 0-200 range with arithmetic
+    # conditionals rather than a separate test per bound:
+    # - CPU: high CPU usage = lower swappiness
+    # - IO: high IO = higher swappiness
+    # - Network: high network = moderate swappiness
+    local cpu_based_swappiness=$(( cpu_usage > 100 ? 0 : 200 - cpu_usage * 2 ))
+    local io_based_swappiness=$(( io_usage > 100 ? 200 : io_usage * 2 ))
+    local network_based_swappiness=$(( network_usage > 150 ? 200 : network_usage + 50 ))
     
     # Calculate weighted average swappiness based on workload weights
     # Using integer weights (out of 100) 
@@ -298,17 +373,9 @@ calculate_optimal_swappiness() {
          network_based_swappiness * NETWORK_WEIGHT) / 100 
     ))
     
-    # Ensure swappiness is within valid range
-    if [ "$swappiness_value" -lt 0 ]; then
-        swappiness_value=0
-    elif [ "$swappiness_value" -gt 200 ]; then
-        swappiness_value=200
-    fi
-    
-    # Round to nearest multiple of 5
-    swappiness_value=$(( (swappiness_value + 2) / 5 * 5 ))
-    
-    echo $swappiness_value
+    # Ensure swappiness is within valid range, then round to nearest multiple of 5
+    swappiness_value=$(( swappiness_value < 0 ? 0 : swappiness_value > 200 ? 200 : swappiness_value ))
+    OPTIMAL_SWAPPINESS=$(( (swappiness_value + 2) / 5 * 5 ))
 }
 
 # Save original swappiness to restore on exit
@@ -318,11 +385,17 @@ ORIGINAL_SWAPPINESS=$(get_swappiness)
 cleanup() {
     echo "Restoring original swappiness value: $ORIGINAL_SWAPPINESS"
     set_swappiness $ORIGINAL_SWAPPINESS
-    echo "$(date "+%Y-%m-%d %H:%M:%S"): Daemon stopped, swappiness restored to $ORIGINAL_SWAPPINESS" >> $LOG_FILE
-    echo "-------" >> $LOG_FILE
+    {
+        printf '%(%Y-%m-%d %H:%M:%S)T: ' -1
+        echo "Daemon stopped, swappiness restored to $ORIGINAL_SWAPPINESS"
+        echo "-------"
+    } >&"${LOG_FD}"
     exit 0
 }
 
+# Open the log once for the lifetime of the daemon
+open_log
+
 # Set up trap for clean exit
 trap cleanup SIGINT SIGTERM
 
@@ -335,20 +408,46 @@ echo "Original swappiness: $ORIGINAL_SWAPPINESS"
 echo "Logging to: $LOG_FILE"
 
 # Initial log entry
-echo "$(date "+%Y-%m-%d %H:%M:%S"): Swap daemon started" >> $LOG_FILE
-echo "Original swappiness: $ORIGINAL_SWAPPINESS" >> $LOG_FILE
-echo "-------" >> $LOG_FILE
+{
+    printf '%(%Y-%m-%d %H:%M:%S)T: ' -1
+    echo "Swap daemon started"
+    echo "Original swappiness: $ORIGINAL_SWAPPINESS"
+    echo "-------"
+} >&"${LOG_FD}"
+
+# Count existing timestamp entries once; log_metrics keeps the count up to date afterwards
+LOG_ENTRIES=$(grep -c "^[0-9]\{4\}-[0-9]\{2\}-[0-9]\{2\} [0-9]\{2\}:[0-9]\{2\}:[0-9]\{2\}:" "${LOG_FILE}" 2>/dev/null)
+LOG_ENTRIES=${LOG_ENTRIES:-0}
+
+# Prime the CPU and network counters, then wait so the first check's deltas span a real window
+get_cpu_usage
+get_network_usage
+sleep 1
+
+# Track swappiness here instead of re-reading it every check; set_swappiness reports what the kernel accepted
+current_swappiness=$ORIGINAL_SWAPPINESS
+unchanged_checks=0
 
 while true; do
+    # Schedule the next check on the monotonic clock so sampling time counts towards the interval
+    read_uptime
+    next_check_cs=$((UPTIME_CS + CHECK_INTERVAL * 100))
+    
     # Get current system metrics
     mem_usage=$(get_memory_usage)
-    cpu_usage=$(get_cpu_usage)
+    # The disk list is only used by get_io_usage's fallback when iostat is missing
+    if ! command -v iostat >/dev/null 2>&1; then
+        refresh_disks
+    fi
     io_usage=$(get_io_usage)
-    network_usage=$(get_network_usage)
-    current_swappiness=$(get_swappiness)
+    get_cpu_usage
+    cpu_usage=$CPU_USAGE
+    get_network_usage
+    network_usage=$NETWORK_USAGE
     
     # Calculate adjusted swappiness for current system state
-    optimal_swappiness=$(calculate_optimal_swappiness $mem_usage $cpu_usage $io_usage $network_usage)
+    calculate_optimal_swappiness $mem_usage $cpu_usage $io_usage $network_usage
+    optimal_swappiness=$OPTIMAL_SWAPPINESS
     
     echo "Current metrics: Memory: $mem_usage%, CPU: $cpu_usage%, IO: $io_usage%, Network: $network_usage%"
     echo "Current swappiness: $current_swappiness, Optimal swappiness: $optimal_swappiness"
@@ -358,15 +457,26 @@ while true; do
     if [ $(( current_swappiness - optimal_swappiness )) -gt 5 ] || [ $(( optimal_swappiness - current_swappiness )) -gt 5 ]; then
         echo "Adjusting swappiness from $current_swappiness to $optimal_swappiness based on weighted system metrics"
         set_swappiness $optimal_swappiness
+        current_swappiness=$SWAPPINESS
+        unchanged_checks=0
         # Log the change
-        log_metrics $mem_usage $cpu_usage $io_usage $network_usage $optimal_swappiness $ORIGINAL_SWAPPINESS
+        log_metrics $mem_usage $cpu_usage $io_usage $network_usage $current_swappiness $ORIGINAL_SWAPPINESS
     else
         echo "Current swappiness ($current_swappiness) is already close to optimal ($optimal_swappiness), no change needed"
-        # Log the current state even when no change is made
-        log_metrics $mem_usage $cpu_usage $io_usage $network_usage $current_swappiness $ORIGINAL_SWAPPINESS
+        # Periodically log the current state even when no change is made
+        unchanged_checks=$((unchanged_checks + 1))
+        if [ "$LOG_UNCHANGED_EVERY" -gt 0 ] && [ "$unchanged_checks" -ge "$LOG_UNCHANGED_EVERY" ]; then
+            log_metrics $mem_usage $cpu_usage $io_usage $network_usage $current_swappiness $ORIGINAL_SWAPPINESS
+            unchanged_checks=0
+        fi
     fi
     
-    # Wait before checking again
-    sleep "$CHECK_INTERVAL"
+    # Wait out the rest of the interval before checking again
+    read_uptime
+    remaining_cs=$((next_check_cs - UPTIME_CS))
+    if [ "$remaining_cs" -gt 0 ]; then
+        printf -v remaining '%d.%02d' $((remaining_cs / 100)) $((remaining_cs % 100))
+        sleep "$remaining"
+    fi
 done
 
@@ -103,34 +103,38 @@ run_prime_workload() {
     
     echo "Thread $thread_id started: checking range $start_range to $end_range"
     
-    while [ $(date +%s) -lt $end_time ]; do
+    # Read the clock with printf's %(...)T rather than forking date on every pass
+    local now
+    printf -v now '%(%s)T' -1
+    while [ $now -lt $end_time ]; do
         # Find prime numbers using trial division
+        # Arithmetic commands keep the hot loop in bash's expression evaluator
+        # instead of going through the [ builtin's argument parsing per test
         for ((num=start_range; num<=end_range; num++)); do
             is_prime=1
-            if [ $num -le 1 ]; then
+            if (( num <= 1 )); then
                 is_prime=0
-            elif [ $num -eq 2 ] || [ $num -eq 3 ]; then
+            elif (( num == 2 || num == 3 )); then
                 is_prime=1
-            elif [ $((num % 2)) -eq 0 ]; then
+            elif (( num % 2 == 0 )); then
                 is_prime=0
             else
                 for (( i=3; i*i<=num; i+=2 )); do
-                    if [ $((num % i)) -eq 0 ]; then
+                    if (( num % i == 0 )); then
                         is_prime=0
                         break
                     fi
                 done
             fi
             
-            if [ $is_prime -eq 1 ]; then
-                primes_found=$((primes_found + 1))
-            fi
+            (( primes_found += is_prime ))
         done
         
         # Sleep based on intensity
         if [ $intensity -lt 100 ]; then
             sleep 0.$sleep_time
         fi
+        printf -v now '%(%s)T' -1
     done
     
     echo "Thread $thread_id completed with $primes_found primes found in range $start_range to $end_range"
@@ -6,6 +6,7 @@ FILE_SIZE=1  # Size in MB
 OUTPUT_DIR="/tmp/io_pressure_test"
 DURATION=60   # Test duration in seconds
 THREADS=4     # Number of parallel I/O threads
+IO_DEPTH=8    # Number of in-flight file operations per thread
 CLEANUP=true
 IO_PATTERN="random"  # I/O pattern: random, sequential, or mixed
 
@@ -20,6 +21,7 @@ usage() {
     echo "  --output_dir DIR    Directory to create files in (default: $OUTPUT_DIR)"
     echo "  --duration SEC      Duration of the test in seconds (default: $DURATION)"
     echo "  --threads NUM       Number of parallel I/O threads (default: $THREADS)"
+    echo "  --io_depth NUM      In-flight file writes/reads per thread (default: $IO_DEPTH)"
     echo "  --io_pattern TYPE   I/O pattern: random, sequential, mixed (default: $IO_PATTERN)"
     echo "  --no_cleanup        Don't delete the files after the test"
     echo "  --help              Display this help message and exit"
@@ -50,6 +52,10 @@ while [[ $# -gt 0 ]]; do
             THREADS="$2"
             shift 2
             ;;
+        --io_depth)
+            IO_DEPTH="$2"
+            shift 2
+            ;;
         --io_pattern)
             IO_PATTERN="$2"
             shift 2
@@ -91,6 +97,11 @@ if ! [[ "$THREADS" =~ ^[0-9]+$ ]]; then
     exit 1
 fi
 
+if ! [[ "$IO_DEPTH" =~ ^[0-9]+$ ]] || [ "$IO_DEPTH" -lt 1 ]; then
+    echo "Error: --io_depth must be a positive integer"
+    exit 1
+fi
+
 # Validate IO pattern
 if [[ ! "$IO_PATTERN" =~ ^(random|sequential|mixed)$ ]]; then
     echo "Error: --io_pattern must be 'random', 'sequential', or 'mixed'"
@@ -108,11 +119,18 @@ if [ ! -d "$OUTPUT_DIR" ]; then
 fi
 
 echo "Starting intensive I/O pressure test..."
-echo "Using $THREADS parallel threads"
+echo "Using $THREADS parallel threads with up to $IO_DEPTH in-flight operations each"
 echo "Creating and manipulating $NUM_FILES files of ${FILE_SIZE}MB each in $OUTPUT_DIR"
 echo "I/O pattern: $IO_PATTERN"
 echo "Test will run for approximately $DURATION seconds"
 
+# Generate random data once so the write phases measure the disk, not the kernel RNG
+RANDOM_SOURCE="$OUTPUT_DIR/random_source.dat"
+if ! dd if=/dev/urandom of="$RANDOM_SOURCE" bs=1M count="$FILE_SIZE" 2>/dev/null; then
+    echo "Error: Failed to create random data source $RANDOM_SOURCE"
+    exit 1
+fi
+
 # Function to perform direct I/O operations (bypassing cache)
 perform_direct_io() {
     local file="$1"
@@ -122,7 +140,7 @@ perform_direct_io() {
     case "$pattern" in
         random)
             # Random I/O with direct flag to bypass cache
-            dd if=/dev/urandom of="$file" bs=4K count=$((size_mb*256)) oflag=direct conv=fsync 2>/dev/null
+            dd if="$RANDOM_SOURCE" of="$file" bs=4K count=$((size_mb*256)) oflag=direct conv=fsync 2>/dev/null
             ;;
         sequential)
             # Sequential I/O with direct flag
@@ -131,7 +149,7 @@ perform_direct_io() {
         mixed)
             # Mix of sequential and random I/O
             if [ $((RANDOM % 2)) -eq 0 ]; then
-                dd if=/dev/urandom of="$file" bs=4K count=$((size_mb*256)) oflag=direct conv=fsync 2>/dev/null
+                dd if="$RANDOM_SOURCE" of="$file" bs=4K count=$((size_mb*256)) oflag=direct conv=fsync 2>/dev/null
             else
                 dd if=/dev/zero of="$file" bs=1M count="$size_mb" oflag=direct conv=fsync 2>/dev/null
             fi
@@ -167,28 +185,44 @@ run_io_thread() {
     # Continue running operations until the duration is reached
     while [ $(date +%s) -lt $end_time ]; do
         # Create phase - write files with direct I/O to bypass cache
-        for i in $(seq $start_file $end_file); do
-            perform_direct_io "$thread_dir/file_$i.dat" "$FILE_SIZE" "$IO_PATTERN"
+        # Keep up to $IO_DEPTH writes in flight so the device sees a deeper queue
+        local in_flight=0
+        for ((i=start_file; i<=end_file; i++)); do
+            if [ $in_flight -ge $IO_DEPTH ]; then
+                wait -n
+                in_flight=$((in_flight - 1))
+            fi
+            perform_direct_io "$thread_dir/file_$i.dat" "$FILE_SIZE" "$IO_PATTERN" &
+            in_flight=$((in_flight + 1))
         done
+        wait
         
         # Force sync to ensure data is written to disk
         force_sync
         
-        # Read phase with direct I/O to bypass cache
-        for i in $(seq $start_file $end_file); do
+        # Read phase with direct I/O to bypass cache, same queue depth as writes
+        in_flight=0
+        for ((i=start_file; i<=end_file; i++)); do
             if [ -f "$thread_dir/file_$i.dat" ]; then
+                if [ $in_flight -ge $IO_DEPTH ]; then
+                    wait -n
+                    in_flight=$((in_flight - 1))
+                fi
                 # Use direct I/O for reading to bypass cache
-                dd if="$thread_dir/file_$i.dat" of=/dev/null bs=4K iflag=direct 2>/dev/null
+                dd if="$thread_dir/file_$i.dat" of=/dev/null bs=4K iflag=direct 2>/dev/null &
+                in_flight=$((in_flight + 1))
             fi
         done
+        wait
         
         # Random access phase - seek to random positions and read/write
-        for i in $(seq $start_file $end_file); do
+        for ((i=start_file; i<=end_file; i++)); do
             if [ -f "$thread_dir/file_$i.dat" ]; then
                 # Perform random writes to existing files with direct I/O
                 for j in {1..10}; do
                     local pos=$((RANDOM % (FILE_SIZE * 1024)))
-                    dd if=/dev/urandom of="$thread_dir/file_$i.dat" bs=4K count=1 seek=$pos conv=notrunc oflag=direct 2>/dev/null
+                    local src=$((RANDOM % (FILE_SIZE * 256)))
+                    dd if="$RANDOM_SOURCE" of="$thread_dir/file_$i.dat" bs=4K count=1 skip=$src seek=$pos conv=notrunc oflag=direct 2>/dev/null
                 done
             fi
         done
@@ -197,7 +231,7 @@ run_io_thread() {
         force_sync
         
         # Create small files to increase inode pressure
-        for i in $(seq 1 100); do
+        for ((i=1; i<=100; i++)); do
             echo "data" > "$thread_dir/small_file_$i.txt"
         done
         
@@ -205,9 +239,9 @@ run_io_thread() {
         rm -f "$thread_dir"/small_file_*.txt
         
         # Delete and recreate to maintain continuous I/O pressure
-        for i in $(seq $start_file $end_file); do
-            rm -f "$thread_dir/file_$i.dat"
-        done
+        # A single find covers this thread's files instead of spawning one rm per file,
+        # without putting every path on one argument list
+        find "$thread_dir" -maxdepth 1 -name 'file_*.dat' -delete
     done
     
     # Clean up thread directory at the end if cleanup is enabled
@@ -218,6 +252,21 @@ run_io_thread() {
     echo "Thread $thread_id completed"
 }
 
+# Function to sum sectors read and written across whole disks
+# Reads /proc/diskstats once and sets DISK_SECTORS_READ and DISK_SECTORS_WRITTEN
+read_disk_sectors() {
+    local major minor name reads reads_merged sectors_read read_time writes writes_merged sectors_written rest
+    DISK_SECTORS_READ=0
+    DISK_SECTORS_WRITTEN=0
+    while read -r major minor name reads reads_merged sectors_read read_time writes writes_merged sectors_written rest; do
+        # Whole disks only (SATA, NVMe, eMMC/SD, Xen, virtio) so partitions aren't counted twice
+        if [[ "$name" =~ ^(sd[a-z]+|nvme[0-9]+n[0-9]+|mmcblk[0-9]+|xvd[a-z]+|vd[a-z]+)$ ]]; then
+            DISK_SECTORS_READ=$((DISK_SECTORS_READ + sectors_read))
+            DISK_SECTORS_WRITTEN=$((DISK_SECTORS_WRITTEN + sectors_written))
+        fi
+    done < /proc/diskstats
+}
+
 # Start the I/O threads
 echo "Starting $THREADS I/O threads..."
 for ((i=0; i<THREADS; i++)); do
@@ -226,6 +275,9 @@ done
 
 # Display progress
 start_time=$(date +%s)
+read_disk_sectors
+prev_sectors_read=$DISK_SECTORS_READ
+prev_sectors_written=$DISK_SECTORS_WRITTEN
 while [ $(date +%s) -lt $((start_time + DURATION)) ]; do
     current_time=$(date +%s)
     elapsed=$((current_time - start_time))
@@ -242,13 +294,13 @@ while [ $(date +%s) -lt $((start_time + DURATION)) ]; do
     done
     bar+="]"
     
-    # Get current I/O stats
-    if command -v iostat &>/dev/null; then
-        io_stats=$(iostat -d -k 1 2 | tail -4 | head -1)
-        echo -ne "Progress: $bar $percent% ($elapsed/$DURATION seconds) | I/O: $io_stats\r"
-    else
-        echo -ne "Progress: $bar $percent% ($elapsed/$DURATION seconds)\r"
-    fi
+    # Get I/O throughput since the last update (512-byte sectors, ~1 second apart)
+    read_disk_sectors
+    read_kb=$(( (DISK_SECTORS_READ - prev_sectors_read) / 2 ))
+    write_kb=$(( (DISK_SECTORS_WRITTEN - prev_sectors_written) / 2 ))
+    prev_sectors_read=$DISK_SECTORS_READ
+    prev_sectors_written=$DISK_SECTORS_WRITTEN
+    echo -ne "Progress: $bar $percent% ($elapsed/$DURATION seconds) | I/O: read ${read_kb} kB/s, write ${write_kb} kB/s\r"
     
     sleep 1
 done
@@ -261,6 +313,7 @@ if [ "$CLEANUP" = true ]; then
     echo "Cleaning up remaining files..."
     rm -rf "$OUTPUT_DIR"
 else
+    rm -f "$RANDOM_SOURCE"
     echo "Skipping cleanup as requested. Files remain in $OUTPUT_DIR"
 fi
 